@@ -1,55 +1,99 @@
-import os, re, asyncio, logging, threading, requests, nest_asyncio
+import os, re, time, asyncio, logging, aiohttp
 
 from datetime import datetime, timedelta, timezone as dt_timezone
+from contextlib import suppress
 
-from flask import Flask
-from bs4 import BeautifulSoup
+from aiohttp import web
+from aiolimiter import AsyncLimiter
+from selectolax.parser import HTMLParser
 from dotenv import load_dotenv
-from pytz import timezone
+from zoneinfo import ZoneInfo
 from functools import lru_cache
 
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 from telegram.error import TimedOut, NetworkError, RetryAfter
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from database import init_db, init_state_db, add_subscriber, remove_subscriber, get_all_subscribers, get_state, set_state
+from database import init_db, add_subscriber, remove_subscriber, get_all_subscribers, get_state, set_state, set_states
 
 # === Configuration ===
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WBGT_STATION_ID = "S106"  # Pulau Ubin
+SGT = ZoneInfo("Asia/Singapore")
+
+# === HTTP Session ===
+# Created in post_init so it binds to the bot's event loop; reused for every poll
+_http_session: aiohttp.ClientSession = None
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10, sock_connect=3.05)
+HTTP_MAX_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.5  # seconds, doubled after each attempt
+HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+HTTP_RETRY_AFTER_MAX = 10  # seconds; caps a server's Retry-After so polls aren't held too long
+
+def retry_after_seconds(resp):
+    # Only the delta-seconds form; an HTTP-date Retry-After falls back to the backoff
+    try:
+        return min(float(resp.headers.get("Retry-After", 0)), HTTP_RETRY_AFTER_MAX)
+    except ValueError:
+        return 0
+
+async def fetch(url, as_json=True):
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        delay = HTTP_RETRY_BACKOFF * 2 ** attempt
+        try:
+            async with _http_session.get(url) as resp:
+                if resp.status not in HTTP_RETRY_STATUSES or attempt == HTTP_MAX_RETRIES:
+                    # Error pages must reach the callers' except paths, not be parsed as data
+                    resp.raise_for_status()
+                    return await resp.json(content_type=None) if as_json else await resp.read()
+                delay = max(delay, retry_after_seconds(resp))
+                logging.warning(f"HTTP {resp.status} from {url}, retrying in {delay:.1f}s")
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+            logging.warning(f"Connection error for {url}: {e!r}, retrying")
+        await asyncio.sleep(delay)
 
 # === State Trackers ===
 init_db()
-init_state_db()
 last_zone = get_state("last_zone")
 last_cat1_status = get_state("last_cat1_status")
 last_cat1_range = get_state("last_cat1_range")
 
+defaults = {}
+
 if last_zone is None:
     last_zone = "Green"
-    set_state("last_zone", last_zone)
+    defaults["last_zone"] = last_zone
 
 if last_cat1_status is None:
     last_cat1_status = "clear"
-    set_state("last_cat1_status", last_cat1_status)
+    defaults["last_cat1_status"] = last_cat1_status
 
 if last_cat1_range is None:
     last_cat1_range = None
-    set_state("last_cat1_range", last_cat1_range)
+    defaults["last_cat1_range"] = last_cat1_range
+
+if defaults:
+    set_states(defaults)
 
 # === Logging ===
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # === WBGT Fetch ===
-def calculate_wbgt():
+# NEA publishes WBGT hourly, so the calibration constant is reused between polls
+CALIBRATION_TTL = 1800  # seconds
+_calib_cache = {"ts": 0.0, "c": None}
+
+async def calculate_wbgt():
     try:
-        # Step 1: Fetch air temperature and RH data
+        # Step 1: Fetch air temperature, RH and (unless calibration is cached) WBGT data concurrently
         urls = {
             "air_temperature": "https://api-open.data.gov.sg/v2/real-time/api/air-temperature",
             "relative_humidity": "https://api-open.data.gov.sg/v2/real-time/api/relative-humidity"
         }
+        wbgt_url = "https://api-open.data.gov.sg/v2/real-time/api/weather?api=wbgt"
 
         # NEA WBGT station IDs -> Matching NEA Temp/RH station IDs
         station_map = {
@@ -60,56 +104,71 @@ def calculate_wbgt():
         ubin_station = "S106"        # Pulau Ubin (Temp/RH only)
         fallback_station = "S24"     # Changi
 
-        all_needed_temp_rh_ids = list(station_map.values()) + [ubin_station, fallback_station]
+        calib_cached = _calib_cache["c"] is not None and time.monotonic() - _calib_cache["ts"] < CALIBRATION_TTL
+
+        if calib_cached:
+            all_needed_temp_rh_ids = frozenset((ubin_station, fallback_station))
+        else:
+            all_needed_temp_rh_ids = frozenset((*station_map.values(), ubin_station, fallback_station))
         weather_data = {}
 
-        for key, url in urls.items():
-            resp = requests.get(url, timeout=10)
-            data = resp.json()
+        pending = [fetch(urls["air_temperature"]), fetch(urls["relative_humidity"])]
+        if not calib_cached:
+            pending.append(fetch(wbgt_url))
+        responses = await asyncio.gather(*pending)
 
+        for key, data in zip(urls, responses[:2]):
             if data.get("code") != 0:
                 logging.warning(f"{key} API error: {data.get('errorMsg')}")
                 return None
 
-            reading_map = {entry["stationId"]: entry["value"] for entry in data["data"]["readings"][0]["data"]}
-            weather_data[key] = {sid: reading_map.get(sid) for sid in all_needed_temp_rh_ids}
-            weather_data["timestamp"] = data["data"]["readings"][0]["timestamp"]
+            weather_data[key] = {
+                entry["stationId"]: entry["value"]
+                for entry in data["data"]["readings"][0]["data"]
+                if entry["stationId"] in all_needed_temp_rh_ids
+            }
 
-        # Step 2: Fetch NEA WBGT readings for calibration stations
-        resp = requests.get("https://api-open.data.gov.sg/v2/real-time/api/weather?api=wbgt", timeout=10)
-        wbgt_data = resp.json()
-        readings = wbgt_data["data"]["records"][0]["item"]["readings"]
+        weather_data["timestamp"] = responses[0]["data"]["readings"][0]["timestamp"]
 
-        nea_wbgt = {}
-        for r in readings:
-            sid = r["station"]["id"]
-            if sid in station_map:
-                try:
-                    nea_wbgt[sid] = float(r["wbgt"])
-                except (ValueError, KeyError, TypeError):
-                    logging.warning(f"Invalid WBGT value for station {sid}")
-        logging.info(f"Fetched NEA WBGT values: {nea_wbgt}")
-
-        # Step 3: Calculate average calibration constant c
-        c_values = []
-        for wbgt_sid, tr_sid in station_map.items():
-            temp = weather_data["air_temperature"].get(tr_sid)
-            rh = weather_data["relative_humidity"].get(tr_sid)
-            actual = nea_wbgt.get(wbgt_sid)
-
-            logging.info(f"[DEBUG] Calibrating {wbgt_sid} -> Temp: {temp}, RH: {rh}, Actual WBGT: {actual}")
-
-            if temp is not None and rh is not None and actual is not None:
-                estimated = 0.7 * temp + 0.2 * rh
-                c = actual - estimated
-                c_values.append(c)
-                logging.info(f"{wbgt_sid} (mapped from {tr_sid}): Temp={temp}, RH={rh}, Estimated={estimated:.2f}, Actual={actual:.2f}, c={c:.3f}")
-
-        if not c_values:
-            raise ValueError("No valid calibration data from NEA stations")
-
-        avg_c = sum(c_values) / len(c_values)
-        logging.info(f"Average Calibration Constant C: {avg_c:.3f}")
+        if calib_cached:
+            avg_c = _calib_cache["c"]
+            logging.info(f"Using cached Calibration Constant C: {avg_c:.3f}")
+        else:
+            # Step 2: Read NEA WBGT readings for calibration stations
+            wbgt_data = responses[2]
+            readings = wbgt_data["data"]["records"][0]["item"]["readings"]
+
+            nea_wbgt = {}
+            for r in readings:
+                sid = r["station"]["id"]
+                if sid in station_map:
+                    try:
+                        nea_wbgt[sid] = float(r["wbgt"])
+                    except (ValueError, KeyError, TypeError):
+                        logging.warning(f"Invalid WBGT value for station {sid}")
+            logging.info(f"Fetched NEA WBGT values: {nea_wbgt}")
+
+            # Step 3: Calculate average calibration constant c
+            c_values = []
+            for wbgt_sid, tr_sid in station_map.items():
+                temp = weather_data["air_temperature"].get(tr_sid)
+                rh = weather_data["relative_humidity"].get(tr_sid)
+                actual = nea_wbgt.get(wbgt_sid)
+
+                logging.info(f"[DEBUG] Calibrating {wbgt_sid} -> Temp: {temp}, RH: {rh}, Actual WBGT: {actual}")
+
+                if temp is not None and rh is not None and actual is not None:
+                    estimated = 0.7 * temp + 0.2 * rh
+                    c = actual - estimated
+                    c_values.append(c)
+                    logging.info(f"{wbgt_sid} (mapped from {tr_sid}): Temp={temp}, RH={rh}, Estimated={estimated:.2f}, Actual={actual:.2f}, c={c:.3f}")
+
+            if not c_values:
+                raise ValueError("No valid calibration data from NEA stations")
+
+            avg_c = sum(c_values) / len(c_values)
+            logging.info(f"Average Calibration Constant C: {avg_c:.3f}")
+            _calib_cache.update(ts=time.monotonic(), c=avg_c)
 
         # Step 4: Compute WBGT for Pulau Ubin (fallback to Changi if either value is missing)
         ubin_temp = weather_data["air_temperature"].get(ubin_station)
@@ -140,6 +199,7 @@ def calculate_wbgt():
         logging.error(f"Error calculating WBGT: {e}")
         return None
 
+@lru_cache(maxsize=8)
 def get_wbgt_zone(wbgt):
     if wbgt <= 30.9:
         return "Green"
@@ -150,54 +210,67 @@ def get_wbgt_zone(wbgt):
     else:
         return "Black"
 
+@lru_cache(maxsize=8)
 def get_wbgt_advisory(wbgt):
     zone = get_wbgt_zone(wbgt)
     if "Green" in zone:
-        return [
+        return (
             "Code Green 🟩",
             "45min work : 15min rest",
             "Consume 0.5L/hour of water during activity"
-        ]
+        )
     elif "Yellow" in zone:
-        return [
+        return (
             "Code Yellow 🟨",
             "30min work : 15min rest",
             "Hydrate 0.5L/hour of water! Monitor body for signs and symptoms of heat-related illness!"
-        ]
+        )
     elif "Red" in zone:
-        return [
+        return (
             "Code Red 🟥",
             "30min work : 30min rest",
             "Take frequent breaks & Hydrate 0.75L/hour of water! Monitor body for signs and symptoms of heat-related illness!"
-        ]
+        )
     else:
-        return [
+        return (
             "Code Black ⬛",
             "15min work : 30min rest",
             "Hydrate 0.75L/hour of water! Delay & postpone outdoor activity if possible"
-        ]
+        )
 
 # === CAT 1 Forecast ===
-def fetch_cat1_sector17():
+CAT1_FETCH_FAILED_MSG = "⚠️ Failed to fetch CAT 1 status."
+# "(HHMM-HHMM) sectors" blocks in the Lightningrisk channel
+_CAT1_RE = re.compile(r'\((\d{4})-(\d{4})\)\s*([^\n()]+)')
+# Time ranges in the status messages built by fetch_cat1_sector17
+_FORECAST_RE = re.compile(r"from (\d{4})–(\d{4})")
+_ACTIVE_RE = re.compile(r"\((\d{4})–(\d{4})\)")
+_END_RE = re.compile(r"till (\d{4})")
+
+def _parse_hhmm(s, base):
+    # "HHMM" on the same day (and timezone) as base; raises ValueError on bad times
+    return base.replace(hour=int(s[:2]), minute=int(s[2:]), second=0, microsecond=0)
+
+async def fetch_cat1_sector17():
     last_cat1_range = get_state("last_cat1_range")
 
     try:
-        resp = requests.get('https://t.me/s/Lightningrisk', timeout=10)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        last_msg = soup.select('.tgme_widget_message_wrap .tgme_widget_message_text')[-1]
-        if not last_msg:
+        # Raw (already gunzipped) bytes; selectolax decodes them in C
+        html = await fetch('https://t.me/s/Lightningrisk', as_json=False)
+        messages = HTMLParser(html).css('.tgme_widget_message_wrap .tgme_widget_message_text')
+        if not messages:
+            # Error, rate-limit and interstitial pages have no messages; never report those as clear
             logging.warning("No message found in Lightningrisk channel.")
-            return "clear", "✅ Sector 17 is currently clear."
+            return "clear", CAT1_FETCH_FAILED_MSG
 
-        text = last_msg.get_text().replace("\u200e", "")
+        text = messages[-1].text().replace("\u200e", "")
 
-        matches = re.findall(r'\((\d{4})-(\d{4})\)\s*([^\n()]+)', text)
+        matches = _CAT1_RE.findall(text)
         if not matches:
             logging.warning("CAT 1 parsing failed. Message: %s", text)
             return "clear", "✅ Sector 17 is currently clear."
 
-        sgt = timezone("Asia/Singapore")
-        sgt_now = datetime.now(sgt)
+        sgt_now = datetime.now(SGT)
 
         for start, end, sector_block in matches:
             sectors = [s.strip().lstrip("0").upper() for s in sector_block.split(',')]
@@ -205,16 +278,11 @@ def fetch_cat1_sector17():
 
             if '17' in sectors:
                 try:
-                    block_start_naive = datetime.strptime(start, "%H%M").replace(
-                        year=sgt_now.year, month=sgt_now.month, day=sgt_now.day)
-                    block_end_naive = datetime.strptime(end, "%H%M").replace(
-                        year=sgt_now.year, month=sgt_now.month, day=sgt_now.day)
-
-                    if block_end_naive <= block_start_naive:
-                        block_end_naive += timedelta(days=1)
+                    block_start = _parse_hhmm(start, sgt_now)
+                    block_end = _parse_hhmm(end, sgt_now)
 
-                    block_start = sgt.localize(block_start_naive)
-                    block_end = sgt.localize(block_end_naive)
+                    if block_end <= block_start:
+                        block_end += timedelta(days=1)
 
                     if block_start <= sgt_now <= block_end:
                         if last_cat1_range and block_start <= last_cat1_range[1] and block_end > last_cat1_range[1]:
@@ -229,8 +297,7 @@ def fetch_cat1_sector17():
                                 f"Sector 17 currently under CAT 1 ({start}–{end}). "
                                 f"Head to the nearest shelter!"
                             )
-                        set_state("last_cat1_range", (block_start, block_end))
-                        set_state("last_cat1_status", "active")
+                        set_states({"last_cat1_range": (block_start, block_end), "last_cat1_status": "active"})
                         return "active", msg
 
                     elif sgt_now < block_start:
@@ -241,8 +308,7 @@ def fetch_cat1_sector17():
                                     f"Sector 17 CAT 1 duration extended till {end}. "
                                     f"Stay sheltered until further notice."
                                 )
-                                set_state("last_cat1_range", (block_start, block_end))
-                                set_state("last_cat1_status", "active")
+                                set_states({"last_cat1_range": (block_start, block_end), "last_cat1_status": "active"})
                                 return "active", msg
                             else:
                                 continue
@@ -252,8 +318,7 @@ def fetch_cat1_sector17():
                                 f"Sector 17 expected to enter CAT 1 from {start}–{end}. "
                                 f"Prepare to head to shelter."
                             )
-                            set_state("last_cat1_range", (block_start, block_end))
-                            set_state("last_cat1_status", "active")
+                            set_states({"last_cat1_range": (block_start, block_end), "last_cat1_status": "active"})
                             return "active", msg
 
                 except ValueError:
@@ -265,11 +330,11 @@ def fetch_cat1_sector17():
 
     except Exception as e:
         logging.error(f"Error fetching CAT 1: {e}")
-        return "clear", "⚠️ Failed to fetch CAT 1 status."
+        return "clear", CAT1_FETCH_FAILED_MSG
 
 
     # Respect last forecast if still within range
-    sgt_now = datetime.now(timezone("Asia/Singapore"))
+    sgt_now = datetime.now(SGT)
     if last_cat1_range:
         if sgt_now <= last_cat1_range[1]:
             logging.info("No new forecast, but still within previous CAT 1 range — maintaining forecast status")
@@ -281,34 +346,95 @@ def fetch_cat1_sector17():
         set_state("last_cat1_status", last_cat1_status)
     return "clear", "✅ Sector 17 is currently clear."
 
-def generate_message(wbgt_data, cat1_status_msg):
-    wbgt_time = datetime.strptime(wbgt_data["timestamp"], "%Y-%m-%dT%H:%M:%S%z").astimezone(timezone("Asia/Singapore"))
+# === Shared Poll ===
+# The scheduled jobs and /now share one fetch so overlapping runs don't hit the APIs twice
+POLL_TTL = 60  # seconds
+_last_poll = {"t": 0.0, "wbgt": None, "cat1": None}
+_poll_lock = asyncio.Lock()
+
+async def poll():
+    async with _poll_lock:
+        if time.monotonic() - _last_poll["t"] < POLL_TTL:
+            return _last_poll["wbgt"], _last_poll["cat1"]
+
+        wbgt_data, cat1_status = await asyncio.gather(calculate_wbgt(), fetch_cat1_sector17())
+        # Only cache full successes, so the next caller retries after a transient failure
+        if wbgt_data is not None and cat1_status[1] != CAT1_FETCH_FAILED_MSG:
+            _last_poll.update(t=time.monotonic(), wbgt=wbgt_data, cat1=cat1_status)
+        return wbgt_data, cat1_status
+
+# === Message Templates ===
+_WBGT_STATUS_TEMPLATE = (
+    "*WBGT STATUS (as of {wbgt_time} Hours)*\n"
+    "*🌡️ Temperature:* {wbgt:.1f}°C ({code})\n"
+    "*🧑‍🔧 Work-Rest Cycle:* {cycle}\n"
+    "*💧 Advisory:* {advice}"
+)
+_UPDATE_TEMPLATE = (
+    "*🌤️ Pulau Ubin WBGT Update*\n"
+    "*Time:* {now} Hours\n\n"
+    + _WBGT_STATUS_TEMPLATE + "\n\n"
+    "*CAT 1 STATUS*\n"
+    "{cat1}"
+)
+_WBGT_CHANGE_TEMPLATE = "*🚨 Immediate Update Detected*\n" + _WBGT_STATUS_TEMPLATE
+
+def wbgt_fields(wbgt_data):
+    wbgt_time = datetime.fromisoformat(wbgt_data["timestamp"]).astimezone(SGT)
     wbgt = wbgt_data["value"]
-    zone = get_wbgt_zone(wbgt)
-    advisory = get_wbgt_advisory(wbgt)  # Now returns a list of 3 strings
-
-    return (
-        f"*🌤️ Pulau Ubin WBGT Update*\n"
-        f"*Time:* {datetime.now(timezone('Asia/Singapore')).strftime('%d/%m/%Y %H:%M')} Hours\n\n"
-        f"*WBGT STATUS (as of {wbgt_time.strftime('%H:%M')} Hours)*\n"
-        f"*🌡️ Temperature:* {wbgt:.1f}°C ({advisory[0]})\n"
-        f"*🧑‍🔧 Work-Rest Cycle:* {advisory[1]}\n"
-        f"*💧 Advisory:* {advisory[2]}\n\n"
-        f"*CAT 1 STATUS*\n"
-        f"{cat1_status_msg[1]}"
-    )
+    code, cycle, advice = get_wbgt_advisory(wbgt)  # Cached tuple of 3 strings
+    return {"wbgt_time": wbgt_time.strftime('%H:%M'), "wbgt": wbgt, "code": code, "cycle": cycle, "advice": advice}
+
+def generate_message(wbgt_data, cat1_status_msg):
+    fields = wbgt_fields(wbgt_data)
+    fields["now"] = datetime.now(SGT).strftime('%d/%m/%Y %H:%M')
+    fields["cat1"] = cat1_status_msg[1]
+    return _UPDATE_TEMPLATE.format_map(fields)
+
+# === Telegram Rate Limiting ===
+# Telegram allows ~30 msg/s bot-wide; stay below it so broadcasts don't collect 429s
+SEND_RATE = 25  # messages per second
+_send_limiter = AsyncLimiter(SEND_RATE, 1)
+_send_paused_until = 0.0  # monotonic time; all sends wait after a RetryAfter
+
+async def send_limited(bot, chat_id, text):
+    while True:
+        # Wait out any pause before queueing for a token, so the bucket isn't drained during it
+        while (delay := _send_paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+        async with _send_limiter:
+            # A pause that started while this task queued voids its token; go back and wait
+            if _send_paused_until > time.monotonic():
+                continue
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+            return
 
 async def safe_send(bot, chat_id, text):
-    try:
-        await bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
-    except (TimedOut, NetworkError, RetryAfter) as e:
-        logging.warning(f"Retry sending to {chat_id} due to: {e}")
-        await asyncio.sleep(5)
+    global _send_paused_until
+    retried = False
 
+    while True:
         try:
-            await bot.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+            await send_limited(bot, chat_id, text)
+            return
+        except RetryAfter as e:
+            # Pause every pending send, not just this one, until Telegram lifts the limit.
+            # Throttled sends are always retried so alerts are never dropped for a 429
+            logging.warning(f"Rate limited sending to {chat_id}, pausing sends for {e.retry_after}s")
+            _send_paused_until = max(_send_paused_until, time.monotonic() + e.retry_after)
+        except (TimedOut, NetworkError) as e:
+            if retried:
+                logging.error(f"Final failure for chat {chat_id}: {e}")
+                return
+            logging.warning(f"Retry sending to {chat_id} due to: {e}")
+            await asyncio.sleep(5)
         except Exception as ex:
+            if not retried:
+                raise
             logging.error(f"Final failure for chat {chat_id}: {ex}")
+            return
+        retried = True
 
 async def broadcast_message(app, text):
     subscribers = get_all_subscribers()
@@ -322,27 +448,21 @@ async def broadcast_message(app, text):
     ])
 
 # === Scheduled Tasks ===
-async def scheduled_update(app):
-    global last_cat1_range
+POLL_INTERVAL = 150  # seconds between change checks
+FULL_UPDATE_INTERVAL = 600  # seconds between full WBGT + CAT 1 broadcasts
 
+async def scheduled_update(app, wbgt_data, cat1_status):
     logging.info("Running scheduled update")
 
-    loop = asyncio.get_event_loop()
-    wbgt_task = loop.run_in_executor(None, calculate_wbgt)
-    cat1_task = loop.run_in_executor(None, fetch_cat1_sector17)
-    wbgt_data, cat1_status = await asyncio.gather(wbgt_task, cat1_task)
-
     if not wbgt_data:
         return
 
     msg = generate_message(wbgt_data, cat1_status)
     await broadcast_message(app, msg)
 
-async def check_wbgt_changes(app):
+async def check_wbgt_changes(app, wbgt_data):
     global last_zone
 
-    loop = asyncio.get_event_loop()
-    wbgt_data = await loop.run_in_executor(None, calculate_wbgt)
     if not wbgt_data:
         return
 
@@ -354,50 +474,32 @@ async def check_wbgt_changes(app):
         return
 
     if current_zone != last_zone:
-        wbgt_time = datetime.strptime(wbgt_data["timestamp"], "%Y-%m-%dT%H:%M:%S%z").astimezone(timezone("Asia/Singapore"))
-        wbgt = wbgt_data["value"]
-        advisory = get_wbgt_advisory(wbgt)
-
-        msg = (
-            "*🚨 Immediate Update Detected*\n"
-            f"*WBGT STATUS (as of {wbgt_time.strftime('%H:%M')} Hours)*\n"
-            f"*🌡️ Temperature:* {wbgt:.1f}°C ({advisory[0]})\n"
-            f"*🧑‍🔧 Work-Rest Cycle:* {advisory[1]}\n"
-            f"*💧 Advisory:* {advisory[2]}"
-        )
+        msg = _WBGT_CHANGE_TEMPLATE.format_map(wbgt_fields(wbgt_data))
 
         await broadcast_message(app, msg)
         last_zone = current_zone
         set_state("last_zone", last_zone)
 
-async def check_cat1_changes(app):
+async def check_cat1_changes(app, cat1_status):
     global last_cat1_status, last_cat1_range
 
-    loop = asyncio.get_event_loop()
-    cat1_status = await loop.run_in_executor(None, fetch_cat1_sector17)
-
     current_cat1 = cat1_status[0]
     new_cat1_range = last_cat1_range
 
     if current_cat1 == "active":
-        sgt = timezone("Asia/Singapore")
-        sgt_now = datetime.now(sgt)
-        forecast_match = re.search(r"from (\d{4})–(\d{4})", cat1_status[1])
-        active_match = re.search(r"\((\d{4})–(\d{4})\)", cat1_status[1])
-        end_match = re.search(r"till (\d{4})", cat1_status[1])
+        sgt_now = datetime.now(SGT)
+        forecast_match = _FORECAST_RE.search(cat1_status[1])
+        active_match = _ACTIVE_RE.search(cat1_status[1])
+        end_match = _END_RE.search(cat1_status[1])
 
         for match in (forecast_match, active_match, end_match):
             if match:
                 start_str, end_str = match.groups() if len(match.groups()) == 2 else (None, match.group(1))
                 try:
-                    start_dt = datetime.strptime(start_str or sgt_now.strftime("%H%M"), "%H%M").replace(
-                        year=sgt_now.year, month=sgt_now.month, day=sgt_now.day)
-                    end_dt = datetime.strptime(end_str, "%H%M").replace(
-                        year=sgt_now.year, month=sgt_now.month, day=sgt_now.day)
+                    start_dt = _parse_hhmm(start_str or sgt_now.strftime("%H%M"), sgt_now)
+                    end_dt = _parse_hhmm(end_str, sgt_now)
                     if end_dt <= start_dt:
                         end_dt += timedelta(days=1)
-                    start_dt = sgt.localize(start_dt)
-                    end_dt = sgt.localize(end_dt)
                     new_cat1_range = (start_dt, end_dt)
                 except Exception as e:
                     logging.warning(f"Unable to parse extended CAT 1 time: {e}")
@@ -406,8 +508,7 @@ async def check_cat1_changes(app):
     if last_cat1_status is None:
         last_cat1_status = current_cat1
         last_cat1_range = new_cat1_range
-        set_state("last_cat1_status", last_cat1_status)
-        set_state("last_cat1_range", last_cat1_range)
+        set_states({"last_cat1_status": last_cat1_status, "last_cat1_range": last_cat1_range})
         return
 
     cat1_changed = (
@@ -424,8 +525,25 @@ async def check_cat1_changes(app):
         await broadcast_message(app, msg)
         last_cat1_status = current_cat1
         last_cat1_range = new_cat1_range
-        set_state("last_cat1_status", last_cat1_status)
-        set_state("last_cat1_range", last_cat1_range)
+        set_states({"last_cat1_status": last_cat1_status, "last_cat1_range": last_cat1_range})
+
+async def poller(app):
+    # One loop drives both the change checks and the periodic full update
+    last_full = time.monotonic()
+    while True:
+        tick = time.monotonic()
+        try:
+            wbgt_data, cat1_status = await poll()
+            await check_wbgt_changes(app, wbgt_data)
+            await check_cat1_changes(app, cat1_status)
+
+            if tick - last_full >= FULL_UPDATE_INTERVAL:
+                await scheduled_update(app, wbgt_data, cat1_status)
+                last_full = tick
+        except Exception as e:
+            logging.error(f"Error in poller: {e}")
+
+        await asyncio.sleep(POLL_INTERVAL)
 
 # === Telegram Commands ===
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -441,10 +559,7 @@ async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🚫 Unsubscribed from alerts.")
 
 async def now(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    loop = asyncio.get_event_loop()
-    wbgt_task = loop.run_in_executor(None, calculate_wbgt)
-    cat1_task = loop.run_in_executor(None, fetch_cat1_sector17)
-    wbgt_data, cat1 = await asyncio.gather(wbgt_task, cat1_task)
+    wbgt_data, cat1 = await poll()
 
     if not wbgt_data:
         await update.message.reply_text("⚠️ Could not retrieve WBGT data.")
@@ -453,6 +568,18 @@ async def now(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = generate_message(wbgt_data, cat1)
     await update.message.reply_text(msg, parse_mode="Markdown")
 
+# Telegram file_id of each image after its first upload, so repeats skip the upload
+_PHOTO_CACHE: dict[str, str] = {}
+
+async def reply_photo_cached(update, img_path, caption):
+    if img_path in _PHOTO_CACHE:
+        await update.message.reply_photo(_PHOTO_CACHE[img_path], caption=caption, parse_mode="Markdown")
+        return
+
+    with open(img_path, "rb") as photo:
+        sent = await update.message.reply_photo(photo, caption=caption, parse_mode="Markdown")
+    _PHOTO_CACHE[img_path] = sent.photo[-1].file_id
+
 async def first_aid_sop(update: Update, context: ContextTypes.DEFAULT_TYPE):
     image_caption_pairs = [
         (
@@ -478,8 +605,7 @@ async def first_aid_sop(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"⚠️ Missing image: {os.path.basename(img_path)}")
             continue
 
-        with open(img_path, "rb") as photo:
-            await update.message.reply_photo(photo=photo, caption=caption, parse_mode="Markdown")
+        await reply_photo_cached(update, img_path, caption)
 
 async def medical_tagging(update: Update, context: ContextTypes.DEFAULT_TYPE):
     img_path = os.path.join("img", "MedicalTagging.jpg")
@@ -497,8 +623,7 @@ async def medical_tagging(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "⚪ White - Light Duty (No Vigorous Activity)"
     )
 
-    with open(img_path, "rb") as photo:
-        await update.message.reply_photo(photo, caption=caption, parse_mode="Markdown")
+    await reply_photo_cached(update, img_path, caption)
 
 async def mandown_drill(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caption = (
@@ -537,18 +662,51 @@ async def heat_injury(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text(caption, parse_mode="Markdown")
 
-# === Scheduler Setup ===
-scheduler = AsyncIOScheduler()
+# === Health Check (for Render uptime) ===
+async def index(request):
+    return web.Response(text="Bot is alive")
+
+async def start_health_server():
+    health_app = web.Application()
+    health_app.router.add_get('/', index)
+    runner = web.AppRunner(health_app)
+    await runner.setup()
+    port = int(os.environ.get("PORT", 10000))
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
+
+# === Poller Setup ===
+_poller_task: asyncio.Task = None
+_health_runner: web.AppRunner = None
+
 async def post_init(app):
-    scheduler.add_job(scheduled_update, args=[app], trigger="cron", minute="5,25,45")
-    scheduler.add_job(check_wbgt_changes, args=[app], trigger="cron", minute="*/5")  # every 5 mins
-    scheduler.add_job(check_cat1_changes, args=[app], trigger="cron", minute="*/2")  # every 2 mins
-    scheduler.start()
-    logging.info("Scheduler started")
+    global _http_session, _poller_task, _health_runner
+    _http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=60),
+        timeout=HTTP_TIMEOUT,
+    )
+
+    _health_runner = await start_health_server()
+    logging.info("Health check server started")
+
+    _poller_task = asyncio.create_task(poller(app))
+    logging.info("Poller started")
+
+async def post_shutdown(app):
+    if _poller_task is not None:
+        # Let an in-flight poll unwind before the session it uses is closed
+        _poller_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _poller_task
+    if _health_runner is not None:
+        await _health_runner.cleanup()
+    if _http_session is not None:
+        await _http_session.close()
+    logging.info("HTTP session closed")
 
 # === Bot Entry ===
 def telegram_main():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+    app = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("stop", stop))
     app.add_handler(CommandHandler("now", now))
@@ -559,24 +717,10 @@ def telegram_main():
 
     app.run_polling()
 
-# === Flask (for Render uptime) ===
-flask_app = Flask(__name__)
-@flask_app.route('/')
-def index(): return "Bot is alive"
-
-def run_flask():
-    port = int(os.environ.get("PORT", 10000))
-    flask_app.run(host='0.0.0.0', port=port)
-
 # === Final Startup ===
 if __name__ == "__main__":
-    nest_asyncio.apply()
-
-    # Start Flask in background
-    threading.Thread(target=run_flask, daemon=True).start()
-
     if os.environ.get("IS_MAIN_PROCESS") == "1":
-        # Start Telegram bot and scheduler
+        # Start Telegram bot, poller and health check server
         print("The main instance is running")
         telegram_main()
     else:
@@ -1,55 +1,58 @@
 import sqlite3
 import os
-import json
+import orjson
+import threading
 from datetime import datetime
 
 DB_PATH = "data/data.db"
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# One shared autocommit connection; the lock serialises access from any thread
+_CONN = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+_CONN.execute("PRAGMA journal_mode=WAL")
+_CONN.execute("PRAGMA synchronous=NORMAL")
+_LOCK = threading.Lock()
+
+# In-memory copy of the subscribers table, loaded on first read
+_cache: set[int] | None = None
+
 # === Initialization ===
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
+    with _LOCK:
+        _CONN.executescript("""
             CREATE TABLE IF NOT EXISTS subscribers (
                 chat_id INTEGER PRIMARY KEY
-            )
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
         """)
-        conn.commit()
-
-def init_state_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS state (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )''')
-        conn.commit()
 
 # === Subscriber Logic ===
 def add_subscriber(chat_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO subscribers (chat_id) VALUES (?)", (chat_id,))
-        conn.commit()
+    with _LOCK:
+        _CONN.execute("INSERT OR IGNORE INTO subscribers (chat_id) VALUES (?)", (chat_id,))
+        if _cache is not None:
+            _cache.add(chat_id)
 
 def remove_subscriber(chat_id):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
-        conn.commit()
+    with _LOCK:
+        _CONN.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+        if _cache is not None:
+            _cache.discard(chat_id)
 
 def get_all_subscribers():
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT chat_id FROM subscribers")
-        return {row[0] for row in cursor.fetchall()}
+    global _cache
+    with _LOCK:
+        if _cache is None:
+            _cache = {row[0] for row in _CONN.execute("SELECT chat_id FROM subscribers")}
+        return set(_cache)
 
 # === State Logic ===
-def default_serializer(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    return str(obj)
+def dumps_state(value):
+    # orjson writes datetimes as ISO 8601 natively; anything else unknown falls back to str
+    return orjson.dumps(value, default=str).decode()
 
 def try_parse_datetime(obj):
     # Try to decode a list of 2 datetime strings into a tuple of datetime
@@ -61,17 +64,20 @@ def try_parse_datetime(obj):
     return obj
 
 def get_state(key):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM state WHERE key = ?", (key,))
-        row = cursor.fetchone()
-        if row:
-            value = json.loads(row[0])
-            return try_parse_datetime(value)
-        return None
+    with _LOCK:
+        row = _CONN.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+    if row:
+        value = orjson.loads(row[0])
+        return try_parse_datetime(value)
+    return None
 
 def set_state(key, value):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value, default=default_serializer)))
-        conn.commit()
+    with _LOCK:
+        _CONN.execute("REPLACE INTO state (key, value) VALUES (?, ?)", (key, dumps_state(value)))
+
+def set_states(pairs):
+    # Write several keys in one transaction
+    rows = [(key, dumps_state(value)) for key, value in pairs.items()]
+    with _LOCK, _CONN:
+        _CONN.execute("BEGIN")
+        _CONN.executemany("REPLACE INTO state (key, value) VALUES (?, ?)", rows)